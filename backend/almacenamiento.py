@@ -0,0 +1,94 @@
+"""Conversión entre el formato de la API y el formato almacenado en Mongo.
+
+La API sigue usando ids UUID en texto y fechas ISO en texto. En la base:
+- el id de cada documento es el propio `_id`, como UUID binario (subtipo 4)
+- las referencias (`equipo_id`, `cliente_id`) también son UUID binarios
+- las fechas son `Date` de BSON (las fechas sin hora se guardan a medianoche UTC)
+
+El cliente de Mongo debe crearse con uuidRepresentation="standard" y tz_aware=True.
+"""
+import uuid
+from datetime import datetime, date, time, timezone
+from typing import Optional, Union
+
+# Fechas sin hora (YYYY-MM-DD en la API)
+CAMPOS_FECHA = {"fecha_programada", "fecha_primer_servicio", "fecha_fin_garantia"}
+# Fechas con hora (ISO 8601 completo en la API)
+CAMPOS_FECHA_HORA = {"fecha_creacion"}
+# Referencias a otros documentos
+CAMPOS_REFERENCIA = {"equipo_id", "cliente_id"}
+
+
+def a_uuid(valor: Optional[str]) -> Optional[uuid.UUID]:
+    """UUID en texto -> UUID binario. Un id mal formado no puede existir en la base: devuelve None"""
+    if valor is None or isinstance(valor, uuid.UUID):
+        return valor
+    try:
+        return uuid.UUID(valor)
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+def a_fecha(valor: Union[str, date, None]) -> Optional[datetime]:
+    """Fecha de la API (YYYY-MM-DD o date) -> datetime UTC a medianoche"""
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        valor = date.fromisoformat(valor[:10])
+    if isinstance(valor, datetime):
+        valor = valor.date()
+    return datetime.combine(valor, time.min, tzinfo=timezone.utc)
+
+
+def a_fecha_hora(valor: Union[str, datetime, None]) -> Optional[datetime]:
+    """Fecha y hora ISO de la API -> datetime (UTC si no trae zona)"""
+    if not valor:
+        return None
+    if isinstance(valor, str):
+        valor = datetime.fromisoformat(valor)
+    if valor.tzinfo is None:
+        valor = valor.replace(tzinfo=timezone.utc)
+    return valor
+
+
+def a_bson(doc: dict) -> dict:
+    """Documento de la API (model_dump) -> documento a guardar"""
+    resultado = {}
+    for campo, valor in doc.items():
+        if campo == "id":
+            resultado["_id"] = a_uuid(valor)
+        elif campo in CAMPOS_REFERENCIA:
+            resultado[campo] = a_uuid(valor)
+        elif campo in CAMPOS_FECHA:
+            resultado[campo] = a_fecha(valor)
+        elif campo in CAMPOS_FECHA_HORA:
+            resultado[campo] = a_fecha_hora(valor)
+        else:
+            resultado[campo] = valor
+    return resultado
+
+
+def desde_bson(doc: dict) -> dict:
+    """Documento guardado -> documento de la API.
+    Tolera documentos aún no migrados (id en texto junto a un ObjectId, fechas en texto).
+    """
+    resultado = {}
+    for campo, valor in doc.items():
+        if campo == "_id":
+            if isinstance(valor, uuid.UUID):
+                resultado["id"] = str(valor)
+        elif isinstance(valor, uuid.UUID):
+            resultado[campo] = str(valor)
+        elif isinstance(valor, datetime):
+            resultado[campo] = valor.date().isoformat() if campo in CAMPOS_FECHA else valor.isoformat()
+        else:
+            resultado[campo] = valor
+    return resultado
+
+
+def proyeccion_bson(campos) -> dict:
+    """Proyección de Mongo para campos de la API (id -> _id)"""
+    proy = {("_id" if campo == "id" else campo): 1 for campo in campos}
+    if "_id" not in proy:
+        proy["_id"] = 0
+    return proy
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Migra clientes, equipos y servicios al formato de almacenamiento compacto
+(ver almacenamiento.py): `_id` como UUID binario, referencias como UUID binario
+y fechas como Date de BSON.
+
+Se puede ejecutar con la aplicación en marcha: trabaja en lotes pequeños con
+bulk_write, cada documento se reemplaza por su versión nueva con upsert sobre el
+nuevo `_id`, así que si se interrumpe basta con volver a ejecutarlo. Mientras dura,
+los documentos que aún no se migraron no aparecen en las consultas por id o por fecha.
+
+Las colecciones se migran de hijas a padres (servicios, equipos, clientes). Mientras
+una colección no está migrada sus documentos no se encuentran por id, así que editar
+o eliminar un equipo o un cliente pendiente devuelve 404 en lugar de tocar a medias
+unos hijos que todavía están en el formato antiguo. Aun así, conviene ejecutarla en
+una ventana de mantenimiento si se va a dar de alta o editar equipos mientras dura.
+
+Un valor que no se puede convertir (una fecha como "31/12/2025", una referencia que
+no es un UUID) se deja tal como está y se informa; el resto del documento se migra.
+Un documento cuyo `id` no es un UUID se deja sin migrar y también se informa.
+
+Al terminar elimina el índice sobre `id` (ya no hace falta), recalcula los contadores
+de servicios por día (ocupacion_diaria) y muestra el tamaño de cada colección antes y
+después según collStats. El espacio en disco
+(storageSize) no baja hasta que se ejecuta `compact` sobre la colección.
+
+Uso: python migrar_almacenamiento.py [--lote 500]
+"""
+import argparse
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, ReplaceOne
+
+from almacenamiento import a_bson, a_uuid
+from repositorios import RepositorioMotor
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# De hijas a padres: ver el docstring
+COLECCIONES = ["servicios", "equipos", "clientes"]
+METRICAS = ["count", "size", "avgObjSize", "storageSize", "totalIndexSize"]
+
+
+async def estadisticas(db, nombre: str) -> dict:
+    stats = await db.command("collStats", nombre)
+    return {metrica: stats.get(metrica, 0) for metrica in METRICAS}
+
+
+def convertir(doc: dict) -> tuple:
+    """Documento antiguo (sin `_id`) -> (documento nuevo, campos que se dejaron como estaban)"""
+    nuevo, invalidos = {}, []
+    for campo, valor in doc.items():
+        try:
+            convertido = a_bson({campo: valor})
+        except (ValueError, TypeError):
+            convertido = None
+        # a_uuid devuelve None para un id mal formado en lugar de lanzar
+        if convertido is None or (valor not in (None, "") and None in convertido.values()):
+            invalidos.append(campo)
+            convertido = {campo: valor}
+        nuevo.update(convertido)
+    return nuevo, invalidos
+
+
+async def migrar_coleccion(coleccion, lote: int) -> int:
+    """Convierte los documentos con `id` en texto; devuelve cuántos se migraron"""
+    migrados = 0
+    ultimo = None
+    while True:
+        # Los documentos migrados ya no tienen `id`; los que se dejan sin migrar se saltan
+        # avanzando por el `_id` antiguo
+        filtro = {"id": {"$exists": True}}
+        if ultimo is not None:
+            filtro["_id"] = {"$gt": ultimo}
+        pendientes = await coleccion.find(filtro).sort("_id", 1).limit(lote).to_list(lote)
+        if not pendientes:
+            return migrados
+        ultimo = pendientes[-1]["_id"]
+
+        operaciones = []
+        for doc in pendientes:
+            viejo_id = doc.pop("_id")
+            if a_uuid(doc["id"]) is None:
+                print(f"{coleccion.name} {viejo_id}: id {doc['id']!r} no es un UUID, se deja sin migrar")
+                continue
+            nuevo, invalidos = convertir(doc)
+            for campo in invalidos:
+                print(f"{coleccion.name} {doc['id']}: {campo}={doc[campo]!r} no se pudo convertir, se deja como está")
+            operaciones.append(ReplaceOne({"_id": nuevo["_id"]}, nuevo, upsert=True))
+            operaciones.append(DeleteOne({"_id": viejo_id}))
+        if operaciones:
+            await coleccion.bulk_write(operaciones, ordered=True)
+        migrados += len(operaciones) // 2
+
+
+async def eliminar_indice_id(coleccion):
+    indices = await coleccion.index_information()
+    for nombre, info in indices.items():
+        if info["key"] == [("id", 1)]:
+            await coleccion.drop_index(nombre)
+
+
+def imprimir_reporte(antes: dict, despues: dict):
+    print(f"{'coleccion':<12} {'metrica':<16} {'antes':>14} {'despues':>14} {'cambio':>8}")
+    for nombre in COLECCIONES:
+        for metrica in METRICAS:
+            a, d = antes[nombre][metrica], despues[nombre][metrica]
+            cambio = f"{(d - a) / a * 100:+.1f}%" if a else "-"
+            print(f"{nombre:<12} {metrica:<16} {a:>14} {d:>14} {cambio:>8}")
+
+
+async def main(lote: int):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], uuidRepresentation="standard", tz_aware=True)
+    db = client[os.environ['DB_NAME']]
+
+    try:
+        antes = {nombre: await estadisticas(db, nombre) for nombre in COLECCIONES}
+
+        for nombre in COLECCIONES:
+            migrados = await migrar_coleccion(db[nombre], lote)
+            await eliminar_indice_id(db[nombre])
+            print(f"{nombre}: {migrados} documentos migrados")
+        # Los servicios que aún tenían la fecha en texto no estaban en los contadores
+        repo = RepositorioMotor(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+        try:
+            await repo.reconstruir_ocupacion()
+        finally:
+            await repo.cerrar()
+
+        despues = {nombre: await estadisticas(db, nombre) for nombre in COLECCIONES}
+        imprimir_reporte(antes, despues)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lote", type=int, default=500, help="documentos por bulk_write")
+    args = parser.parse_args()
+    asyncio.run(main(args.lote))
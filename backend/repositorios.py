@@ -0,0 +1,670 @@
+"""Acceso a datos de clientes, equipos y servicios.
+
+Los endpoints hablan con un `Repositorio`; hay dos implementaciones:
+- RepositorioMotor: MongoDB vía Motor, con el formato de almacenamiento de almacenamiento.py
+- RepositorioMemoria: diccionarios indexados en memoria, para tests, benchmarks y desarrollo local
+
+Todos los métodos reciben y devuelven documentos en el formato de la API
+(ids y fechas en texto). Los parámetros `campos` limitan los campos devueltos
+(None = todos).
+"""
+import bisect
+import os
+from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, UpdateOne
+
+from almacenamiento import a_bson, desde_bson, a_uuid, a_fecha, proyeccion_bson
+
+
+class Repositorio(ABC):
+
+    async def iniciar(self):
+        """Prepara el almacenamiento (índices, etc.)"""
+
+    async def cerrar(self):
+        """Libera conexiones"""
+
+    # ---------- clientes ----------
+
+    @abstractmethod
+    async def listar_clientes(self) -> List[dict]: ...
+
+    @abstractmethod
+    async def obtener_cliente(self, cliente_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def nombres_clientes(self, cliente_ids: Iterable[str]) -> Dict[str, str]:
+        """id -> nombre de los clientes indicados"""
+
+    @abstractmethod
+    async def insertar_cliente(self, cliente: dict): ...
+
+    @abstractmethod
+    async def actualizar_cliente(self, cliente_id: str, cambios: dict) -> Optional[dict]:
+        """Devuelve el cliente actualizado, o None si no existe"""
+
+    @abstractmethod
+    async def eliminar_cliente(self, cliente_id: str) -> bool: ...
+
+    @abstractmethod
+    async def cliente_tiene_equipos(self, cliente_id: str) -> bool: ...
+
+    @abstractmethod
+    async def eliminar_cliente_cascada(self, cliente_id: str) -> Optional[dict]:
+        """Elimina el cliente, sus equipos y sus servicios. Devuelve cuántos documentos
+        se eliminaron de cada colección, o None si el cliente no existe
+        """
+
+    # ---------- equipos ----------
+
+    @abstractmethod
+    async def listar_equipos(self, campos: Optional[List[str]] = None) -> List[dict]: ...
+
+    @abstractmethod
+    async def obtener_equipos(self, equipo_ids: Iterable[str], campos: Optional[List[str]] = None) -> Dict[str, dict]:
+        """id -> equipo de los equipos indicados"""
+
+    @abstractmethod
+    async def existe_numero_serie(self, numero_serie: str) -> bool: ...
+
+    @abstractmethod
+    async def insertar_equipo(self, equipo: dict): ...
+
+    @abstractmethod
+    async def actualizar_equipo(self, equipo_id: str, cambios: dict) -> Optional[dict]:
+        """Devuelve el equipo actualizado, o None si no existe"""
+
+    @abstractmethod
+    async def eliminar_equipo(self, equipo_id: str) -> bool:
+        """Elimina el equipo junto con todos sus servicios"""
+
+    @abstractmethod
+    async def garantias_por_vencer(self, desde: date, hasta: date, skip: int, limit: int,
+                                   campos: Optional[List[str]] = None) -> List[dict]:
+        """Equipos en garantía con fecha_fin_garantia en [desde, hasta], ordenados por esa fecha"""
+
+    # ---------- servicios ----------
+
+    @abstractmethod
+    async def buscar_servicios(self, desde: Optional[date] = None, hasta: Optional[date] = None,
+                               equipo_id: Optional[str] = None, campos: Optional[List[str]] = None) -> List[dict]:
+        """Servicios con fecha_programada en [desde, hasta), incluidos los archivados"""
+
+    @abstractmethod
+    async def proximos_servicios(self, desde: date, limite: int) -> List[dict]: ...
+
+    @abstractmethod
+    async def servicios_vencidos(self, antes_de: date, skip: int, limit: int,
+                                 campos: Optional[List[str]] = None) -> List[dict]:
+        """Servicios no autorizados con fecha_programada anterior a `antes_de`, del más antiguo al más reciente"""
+
+    @abstractmethod
+    async def ocupacion_por_dia(self, desde: date, hasta: date) -> Dict[date, int]:
+        """Número de servicios de cada día en [desde, hasta) (los días sin servicios no aparecen).
+        Sale de contadores por día que mantienen las altas y bajas de servicios, sin recorrerlos
+        """
+
+    @abstractmethod
+    async def insertar_servicios(self, servicios: List[dict]): ...
+
+    @abstractmethod
+    async def eliminar_servicios_pendientes(self, equipo_id: str):
+        """Elimina los servicios no autorizados del equipo"""
+
+    @abstractmethod
+    async def autorizar_servicio(self, servicio_id: str, autorizado: bool) -> bool: ...
+
+    @abstractmethod
+    async def archivar_servicios(self, corte: date, lote: int) -> int:
+        """Archiva los servicios autorizados anteriores a `corte`; devuelve cuántos se movieron"""
+
+
+def crear_repositorio() -> Repositorio:
+    """Crea el repositorio indicado por la variable REPOSITORIO (mongo por defecto, o memoria)"""
+    tipo = os.environ.get('REPOSITORIO', 'mongo')
+    if tipo == 'memoria':
+        return RepositorioMemoria()
+    if tipo == 'mongo':
+        return RepositorioMotor(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+    raise ValueError(f"REPOSITORIO desconocido: {tipo}")
+
+
+# ==================== MONGO ====================
+
+class RepositorioMotor(Repositorio):
+
+    def __init__(self, mongo_url: str, db_name: str):
+        # UUIDs como binario subtipo 4 y fechas con zona horaria (ver almacenamiento.py)
+        self.client = AsyncIOMotorClient(mongo_url, uuidRepresentation="standard", tz_aware=True)
+        self.db = self.client[db_name]
+        self._replica_set: Optional[bool] = None
+
+    async def iniciar(self):
+        db = self.db
+        for coleccion in (db.servicios, db.servicios_historico):
+            await coleccion.create_index("fecha_programada")
+            await coleccion.create_index([("equipo_id", 1), ("fecha_programada", 1)])
+        # Índices parciales para los listados de garantías por vencer y servicios vencidos
+        await db.equipos.create_index(
+            "fecha_fin_garantia",
+            name="garantias_por_vencer",
+            partialFilterExpression={"en_garantia": True}
+        )
+        await db.servicios.create_index(
+            [("fecha_programada", 1), ("equipo_id", 1)],
+            name="servicios_vencidos",
+            partialFilterExpression={"autorizado": False}
+        )
+        # Contadores por día para la planificación: se crean la primera vez sobre los datos existentes
+        if not await db.ocupacion_diaria.find_one({}) and await db.servicios.find_one({}, {"_id": 1}):
+            await self.reconstruir_ocupacion()
+
+    async def cerrar(self):
+        self.client.close()
+
+    async def _contar_por_dia(self, filtro: dict, session=None) -> Counter:
+        """Servicios por día que cumplen `filtro` en servicios y servicios_historico
+        (uno que esté a medio archivar y aparezca en ambas cuenta una vez)
+        """
+        fechas = {}
+        for coleccion in (self.db.servicios, self.db.servicios_historico):
+            async for servicio in coleccion.find(filtro, {"fecha_programada": 1}, session=session):
+                fechas[servicio["_id"]] = servicio.get("fecha_programada")
+        # Las fechas aún en texto (documentos sin migrar) no están en los contadores
+        return Counter(fecha for fecha in fechas.values() if isinstance(fecha, datetime))
+
+    async def _sumar_ocupacion(self, por_dia: Counter, signo: int = 1, session=None):
+        operaciones = [
+            UpdateOne({"_id": dia}, {"$inc": {"total": signo * total}}, upsert=True)
+            for dia, total in por_dia.items() if total
+        ]
+        if operaciones:
+            await self.db.ocupacion_diaria.bulk_write(operaciones, ordered=False, session=session)
+
+    async def reconstruir_ocupacion(self):
+        """Recalcula desde cero los contadores de ocupacion_diaria (un recorrido de todos los servicios).
+        Las altas y bajas que coincidan con el recálculo pueden quedar sin contar: ejecutarlo en frío
+        """
+        por_dia = await self._contar_por_dia({})
+        if por_dia:
+            await self.db.ocupacion_diaria.bulk_write(
+                [UpdateOne({"_id": dia}, {"$set": {"total": total}}, upsert=True) for dia, total in por_dia.items()],
+                ordered=False
+            )
+        await self.db.ocupacion_diaria.delete_many({"_id": {"$nin": list(por_dia)}})
+
+    async def es_replica_set(self) -> bool:
+        """Las transacciones solo están disponibles en un replica set (o un cluster con mongos)"""
+        if self._replica_set is None:
+            hello = await self.client.admin.command("hello")
+            self._replica_set = "setName" in hello or hello.get("msg") == "isdbgrid"
+        return self._replica_set
+
+    # ---------- clientes ----------
+
+    async def listar_clientes(self) -> List[dict]:
+        clientes = await self.db.clientes.find({}).to_list(1000)
+        return [desde_bson(cliente) for cliente in clientes]
+
+    async def obtener_cliente(self, cliente_id: str) -> Optional[dict]:
+        cliente = await self.db.clientes.find_one({"_id": a_uuid(cliente_id)})
+        return desde_bson(cliente) if cliente else None
+
+    async def nombres_clientes(self, cliente_ids: Iterable[str]) -> Dict[str, str]:
+        ids = list({a_uuid(cliente_id) for cliente_id in cliente_ids})
+        return {
+            str(cliente["_id"]): cliente["nombre"]
+            async for cliente in self.db.clientes.find({"_id": {"$in": ids}}, {"nombre": 1})
+        }
+
+    async def insertar_cliente(self, cliente: dict):
+        await self.db.clientes.insert_one(a_bson(cliente))
+
+    async def actualizar_cliente(self, cliente_id: str, cambios: dict) -> Optional[dict]:
+        result = await self.db.clientes.update_one({"_id": a_uuid(cliente_id)}, {"$set": a_bson(cambios)})
+        if result.matched_count == 0:
+            return None
+        return await self.obtener_cliente(cliente_id)
+
+    async def eliminar_cliente(self, cliente_id: str) -> bool:
+        result = await self.db.clientes.delete_one({"_id": a_uuid(cliente_id)})
+        return result.deleted_count > 0
+
+    async def cliente_tiene_equipos(self, cliente_id: str) -> bool:
+        return await self.db.equipos.find_one({"cliente_id": a_uuid(cliente_id)}, {"_id": 1}) is not None
+
+    async def eliminar_cliente_cascada(self, cliente_id: str) -> Optional[dict]:
+        if await self.es_replica_set():
+            async with await self.client.start_session() as session:
+                # with_transaction reintenta los TransientTransactionError y los commits de resultado desconocido
+                return await session.with_transaction(
+                    lambda session: self._eliminar_cliente_cascada(cliente_id, session)
+                )
+        return await self._eliminar_cliente_cascada(cliente_id)
+
+    async def _eliminar_cliente_cascada(self, cliente_id: str, session=None) -> Optional[dict]:
+        """Número fijo de operaciones: un distinct para los equipos y un delete_many por colección"""
+        db = self.db
+        cliente_uuid = a_uuid(cliente_id)
+        if not await db.clientes.find_one({"_id": cliente_uuid}, {"_id": 1}, session=session):
+            return None
+
+        equipo_ids = await db.equipos.distinct("_id", {"cliente_id": cliente_uuid}, session=session)
+        # Los equipos antes que sus servicios, como en eliminar_equipo (ver archivar_servicios)
+        equipos = await db.equipos.delete_many({"_id": {"$in": equipo_ids}}, session=session)
+        por_dia = await self._contar_por_dia({"equipo_id": {"$in": equipo_ids}}, session=session)
+        servicios = await db.servicios.delete_many({"equipo_id": {"$in": equipo_ids}}, session=session)
+        historico = await db.servicios_historico.delete_many({"equipo_id": {"$in": equipo_ids}}, session=session)
+        await self._sumar_ocupacion(por_dia, -1, session=session)
+        clientes = await db.clientes.delete_one({"_id": cliente_uuid}, session=session)
+        return {
+            "clientes": clientes.deleted_count,
+            "equipos": equipos.deleted_count,
+            "servicios": servicios.deleted_count,
+            "servicios_historico": historico.deleted_count,
+        }
+
+    # ---------- equipos ----------
+
+    async def listar_equipos(self, campos: Optional[List[str]] = None) -> List[dict]:
+        equipos = await self.db.equipos.find({}, proyeccion_bson(campos) if campos else None).to_list(1000)
+        return [desde_bson(equipo) for equipo in equipos]
+
+    async def obtener_equipos(self, equipo_ids: Iterable[str], campos: Optional[List[str]] = None) -> Dict[str, dict]:
+        ids = list({a_uuid(equipo_id) for equipo_id in equipo_ids})
+        proy = proyeccion_bson(["id", *campos]) if campos else None
+        equipos = await self.db.equipos.find({"_id": {"$in": ids}}, proy).to_list(None)
+        return {equipo["id"]: equipo for equipo in map(desde_bson, equipos)}
+
+    async def existe_numero_serie(self, numero_serie: str) -> bool:
+        return await self.db.equipos.find_one({"numero_serie": numero_serie}, {"_id": 1}) is not None
+
+    async def insertar_equipo(self, equipo: dict):
+        await self.db.equipos.insert_one(a_bson(equipo))
+
+    async def actualizar_equipo(self, equipo_id: str, cambios: dict) -> Optional[dict]:
+        result = await self.db.equipos.update_one({"_id": a_uuid(equipo_id)}, {"$set": a_bson(cambios)})
+        if result.matched_count == 0:
+            return None
+        return desde_bson(await self.db.equipos.find_one({"_id": a_uuid(equipo_id)}))
+
+    async def eliminar_equipo(self, equipo_id: str) -> bool:
+        # Primero el equipo: si no existe (o aún no está migrado) no se toca ningún servicio
+        result = await self.db.equipos.delete_one({"_id": a_uuid(equipo_id)})
+        if result.deleted_count == 0:
+            return False
+        por_dia = await self._contar_por_dia({"equipo_id": a_uuid(equipo_id)})
+        await self.db.servicios.delete_many({"equipo_id": a_uuid(equipo_id)})
+        await self.db.servicios_historico.delete_many({"equipo_id": a_uuid(equipo_id)})
+        await self._sumar_ocupacion(por_dia, -1)
+        return True
+
+    async def garantias_por_vencer(self, desde: date, hasta: date, skip: int, limit: int,
+                                   campos: Optional[List[str]] = None) -> List[dict]:
+        # en_garantia=True en el filtro es lo que permite usar el índice parcial
+        equipos = await self.db.equipos.find(
+            {"en_garantia": True, "fecha_fin_garantia": {"$gte": a_fecha(desde), "$lte": a_fecha(hasta)}},
+            proyeccion_bson(campos) if campos else None
+        ).sort("fecha_fin_garantia", 1).skip(skip).limit(limit).to_list(limit)
+        return [desde_bson(equipo) for equipo in equipos]
+
+    # ---------- servicios ----------
+
+    async def corte_archivo(self) -> Optional[date]:
+        """Fecha hasta la que (excluida) puede haber servicios en servicios_historico"""
+        meta = await self.db.metadatos.find_one({"_id": "archivo"})
+        return meta["corte"].date() if meta else None
+
+    async def buscar_servicios(self, desde: Optional[date] = None, hasta: Optional[date] = None,
+                               equipo_id: Optional[str] = None, campos: Optional[List[str]] = None) -> List[dict]:
+        filtro = {}
+        if equipo_id is not None:
+            filtro["equipo_id"] = a_uuid(equipo_id)
+        rango = {}
+        if desde:
+            rango["$gte"] = a_fecha(desde)
+        if hasta:
+            rango["$lt"] = a_fecha(hasta)
+        if rango:
+            filtro["fecha_programada"] = rango
+        # El _id siempre se pide para poder descartar duplicados entre ambas colecciones
+        proy = proyeccion_bson(["id", *campos]) if campos else None
+
+        servicios = await self.db.servicios.find(filtro, proy).to_list(None)
+        # El histórico solo se consulta si el rango empieza antes del corte
+        corte = await self.corte_archivo()
+        if corte is not None and (desde is None or desde < corte):
+            # Un servicio a medio archivar puede estar en ambas: vale la copia de servicios
+            vistos = {servicio["_id"] for servicio in servicios}
+            servicios += [
+                servicio for servicio in await self.db.servicios_historico.find(filtro, proy).to_list(None)
+                if servicio["_id"] not in vistos
+            ]
+        servicios = [desde_bson(servicio) for servicio in servicios]
+        if campos and "id" not in campos:
+            for servicio in servicios:
+                servicio.pop("id", None)
+        return servicios
+
+    async def proximos_servicios(self, desde: date, limite: int) -> List[dict]:
+        # El corte del archivo siempre es anterior a hoy: los próximos nunca están en el histórico
+        servicios = await self.db.servicios.find(
+            {"fecha_programada": {"$gte": a_fecha(desde)}}
+        ).sort("fecha_programada", 1).to_list(limite)
+        return [desde_bson(servicio) for servicio in servicios]
+
+    async def servicios_vencidos(self, antes_de: date, skip: int, limit: int,
+                                 campos: Optional[List[str]] = None) -> List[dict]:
+        # El histórico solo guarda servicios autorizados, así que no hace falta consultarlo
+        servicios = await self.db.servicios.find(
+            {"autorizado": False, "fecha_programada": {"$lt": a_fecha(antes_de)}},
+            proyeccion_bson(campos) if campos else None
+        ).sort("fecha_programada", 1).skip(skip).limit(limit).to_list(limit)
+        return [desde_bson(servicio) for servicio in servicios]
+
+    async def ocupacion_por_dia(self, desde: date, hasta: date) -> Dict[date, int]:
+        # Un documento por día con servicios, incluidos los archivados (archivar no los cambia)
+        dias = self.db.ocupacion_diaria.find(
+            {"_id": {"$gte": a_fecha(desde), "$lt": a_fecha(hasta)}, "total": {"$gt": 0}}
+        )
+        return {dia["_id"].date(): dia["total"] async for dia in dias}
+
+    async def insertar_servicios(self, servicios: List[dict]):
+        if servicios:
+            documentos = [a_bson(servicio) for servicio in servicios]
+            await self.db.servicios.insert_many(documentos)
+            await self._sumar_ocupacion(Counter(documento["fecha_programada"] for documento in documentos))
+
+    async def eliminar_servicios_pendientes(self, equipo_id: str):
+        pendientes = {"equipo_id": a_uuid(equipo_id), "autorizado": False}
+        servicios = await self.db.servicios.find(pendientes, {"fecha_programada": 1}).to_list(None)
+        ids = [servicio["_id"] for servicio in servicios]
+        result = await self.db.servicios.delete_many({"_id": {"$in": ids}, **pendientes})
+        if result.deleted_count < len(ids):
+            # Alguno se autorizó entre la lectura y el borrado: sigue contando
+            quedan = set(await self.db.servicios.distinct("_id", {"_id": {"$in": ids}}))
+            servicios = [servicio for servicio in servicios if servicio["_id"] not in quedan]
+        await self._sumar_ocupacion(Counter(
+            servicio["fecha_programada"] for servicio in servicios
+            if isinstance(servicio.get("fecha_programada"), datetime)
+        ), -1)
+
+    async def autorizar_servicio(self, servicio_id: str, autorizado: bool) -> bool:
+        db = self.db
+        result = await db.servicios.update_one(
+            {"_id": a_uuid(servicio_id)},
+            {"$set": {"autorizado": autorizado}}
+        )
+        if result.matched_count > 0:
+            return True
+        archivado = await db.servicios_historico.find_one({"_id": a_uuid(servicio_id)})
+        if not archivado:
+            return False
+        if not autorizado:
+            # El histórico solo guarda servicios autorizados: al desautorizar vuelve a servicios
+            archivado["autorizado"] = False
+            await db.servicios.replace_one({"_id": archivado["_id"]}, archivado, upsert=True)
+            await db.servicios_historico.delete_one({"_id": archivado["_id"]})
+        return True
+
+    async def archivar_servicios(self, corte: date, lote: int) -> int:
+        db = self.db
+        corte = a_fecha(corte)
+        # El corte se registra antes de mover nada para que las lecturas ya consulten el histórico
+        await db.metadatos.update_one({"_id": "archivo"}, {"$max": {"corte": corte}}, upsert=True)
+
+        archivables = {"autorizado": True, "fecha_programada": {"$lt": corte}}
+        movidos = 0
+        while True:
+            servicios = await db.servicios.find(archivables).limit(lote).to_list(lote)
+            if not servicios:
+                return movidos
+            ids = [servicio["_id"] for servicio in servicios]
+            # Upsert por _id: si el proceso se corta entre ambos pasos, repetirlo no duplica nada
+            await db.servicios_historico.bulk_write(
+                [ReplaceOne({"_id": servicio["_id"]}, servicio, upsert=True) for servicio in servicios],
+                ordered=False
+            )
+            # Se repite el filtro: un servicio desautorizado entre ambos pasos se queda en servicios
+            result = await db.servicios.delete_many({"_id": {"$in": ids}, **archivables})
+            if result.deleted_count < len(ids):
+                # La copia de lo que este borrado no quitó sobra: o sigue en servicios, o se eliminó
+                # a la vez con su equipo (que siempre se borra antes que sus servicios)
+                vivos = set(await db.servicios.distinct("_id", {"_id": {"$in": ids}}))
+                equipos = set(await db.equipos.distinct(
+                    "_id", {"_id": {"$in": list({servicio["equipo_id"] for servicio in servicios})}}
+                ))
+                sobrantes = [
+                    servicio["_id"] for servicio in servicios
+                    if servicio["_id"] in vivos or servicio["equipo_id"] not in equipos
+                ]
+                await db.servicios_historico.delete_many({"_id": {"$in": sobrantes}})
+            movidos += result.deleted_count
+
+
+# ==================== MEMORIA ====================
+
+def _proyectar(doc: dict, campos: Optional[List[str]]) -> dict:
+    if not campos:
+        return dict(doc)
+    return {campo: doc[campo] for campo in campos if campo in doc}
+
+
+def _descartar(indice: Dict[str, set], clave: str, valor: str):
+    """Quita `valor` del conjunto de `clave` sin volver a crearlo (son defaultdict) y borra los vacíos"""
+    valores = indice.get(clave)
+    if valores is not None:
+        valores.discard(valor)
+        if not valores:
+            del indice[clave]
+
+
+class RepositorioMemoria(Repositorio):
+    """Repositorio en memoria con los mismos índices que usan las consultas en Mongo.
+    No hay histórico: todo queda en memoria, así que archivar no mueve nada.
+    """
+
+    def __init__(self):
+        self.clientes: Dict[str, dict] = {}
+        self.equipos: Dict[str, dict] = {}
+        self.servicios: Dict[str, dict] = {}
+        self._equipos_por_cliente: Dict[str, set] = defaultdict(set)
+        self._equipos_por_numero_serie: Dict[str, set] = defaultdict(set)
+        # (fecha_fin_garantia, id) ordenado, solo equipos en garantía (como el índice parcial)
+        self._garantias: List[tuple] = []
+        self._servicios_por_equipo: Dict[str, set] = defaultdict(set)
+        # (fecha_programada, id) ordenado; las fechas ISO se ordenan bien como texto
+        self._servicios_por_fecha: List[tuple] = []
+        # Lo mismo solo para los no autorizados (como el índice parcial servicios_vencidos)
+        self._pendientes_por_fecha: List[tuple] = []
+        # fecha_programada -> número de servicios (como la colección ocupacion_diaria)
+        self._ocupacion: Counter = Counter()
+
+    # ---------- índices ----------
+
+    def _indexar_equipo(self, equipo: dict):
+        if equipo.get("cliente_id"):
+            self._equipos_por_cliente[equipo["cliente_id"]].add(equipo["id"])
+        self._equipos_por_numero_serie[equipo["numero_serie"]].add(equipo["id"])
+        if equipo.get("en_garantia") and equipo.get("fecha_fin_garantia"):
+            bisect.insort(self._garantias, (equipo["fecha_fin_garantia"], equipo["id"]))
+
+    def _desindexar_equipo(self, equipo: dict):
+        if equipo.get("cliente_id"):
+            _descartar(self._equipos_por_cliente, equipo["cliente_id"], equipo["id"])
+        _descartar(self._equipos_por_numero_serie, equipo["numero_serie"], equipo["id"])
+        if equipo.get("en_garantia") and equipo.get("fecha_fin_garantia"):
+            clave = (equipo["fecha_fin_garantia"], equipo["id"])
+            del self._garantias[bisect.bisect_left(self._garantias, clave)]
+
+    def _quitar_servicio(self, servicio_id: str):
+        servicio = self.servicios.pop(servicio_id)
+        _descartar(self._servicios_por_equipo, servicio["equipo_id"], servicio_id)
+        clave = (servicio["fecha_programada"], servicio_id)
+        del self._servicios_por_fecha[bisect.bisect_left(self._servicios_por_fecha, clave)]
+        if not servicio["autorizado"]:
+            del self._pendientes_por_fecha[bisect.bisect_left(self._pendientes_por_fecha, clave)]
+        self._ocupacion[servicio["fecha_programada"]] -= 1
+        if not self._ocupacion[servicio["fecha_programada"]]:
+            del self._ocupacion[servicio["fecha_programada"]]
+
+    def _servicios_en_rango(self, desde: Optional[date], hasta: Optional[date]) -> List[dict]:
+        inicio = bisect.bisect_left(self._servicios_por_fecha, (desde.isoformat(),)) if desde else 0
+        fin = bisect.bisect_left(self._servicios_por_fecha, (hasta.isoformat(),)) if hasta else None
+        return [self.servicios[servicio_id] for _, servicio_id in self._servicios_por_fecha[inicio:fin]]
+
+    # ---------- clientes ----------
+
+    async def listar_clientes(self) -> List[dict]:
+        return [dict(cliente) for cliente in self.clientes.values()]
+
+    async def obtener_cliente(self, cliente_id: str) -> Optional[dict]:
+        cliente = self.clientes.get(cliente_id)
+        return dict(cliente) if cliente else None
+
+    async def nombres_clientes(self, cliente_ids: Iterable[str]) -> Dict[str, str]:
+        return {
+            cliente_id: self.clientes[cliente_id]["nombre"]
+            for cliente_id in set(cliente_ids) if cliente_id in self.clientes
+        }
+
+    async def insertar_cliente(self, cliente: dict):
+        self.clientes[cliente["id"]] = dict(cliente)
+
+    async def actualizar_cliente(self, cliente_id: str, cambios: dict) -> Optional[dict]:
+        if cliente_id not in self.clientes:
+            return None
+        self.clientes[cliente_id].update(cambios)
+        return dict(self.clientes[cliente_id])
+
+    async def eliminar_cliente(self, cliente_id: str) -> bool:
+        return self.clientes.pop(cliente_id, None) is not None
+
+    async def cliente_tiene_equipos(self, cliente_id: str) -> bool:
+        return bool(self._equipos_por_cliente.get(cliente_id))
+
+    async def eliminar_cliente_cascada(self, cliente_id: str) -> Optional[dict]:
+        if cliente_id not in self.clientes:
+            return None
+        equipos = servicios = 0
+        for equipo_id in list(self._equipos_por_cliente.pop(cliente_id, ())):
+            servicios += len(self._servicios_por_equipo.get(equipo_id, ()))
+            await self.eliminar_equipo(equipo_id)
+            equipos += 1
+        del self.clientes[cliente_id]
+        return {"clientes": 1, "equipos": equipos, "servicios": servicios, "servicios_historico": 0}
+
+    # ---------- equipos ----------
+
+    async def listar_equipos(self, campos: Optional[List[str]] = None) -> List[dict]:
+        return [_proyectar(equipo, campos) for equipo in self.equipos.values()]
+
+    async def obtener_equipos(self, equipo_ids: Iterable[str], campos: Optional[List[str]] = None) -> Dict[str, dict]:
+        return {
+            equipo_id: _proyectar(self.equipos[equipo_id], ["id", *campos] if campos else None)
+            for equipo_id in set(equipo_ids) if equipo_id in self.equipos
+        }
+
+    async def existe_numero_serie(self, numero_serie: str) -> bool:
+        return numero_serie in self._equipos_por_numero_serie
+
+    async def insertar_equipo(self, equipo: dict):
+        self.equipos[equipo["id"]] = dict(equipo)
+        self._indexar_equipo(equipo)
+
+    async def actualizar_equipo(self, equipo_id: str, cambios: dict) -> Optional[dict]:
+        equipo = self.equipos.get(equipo_id)
+        if equipo is None:
+            return None
+        self._desindexar_equipo(equipo)
+        equipo.update(cambios)
+        self._indexar_equipo(equipo)
+        return dict(equipo)
+
+    async def eliminar_equipo(self, equipo_id: str) -> bool:
+        for servicio_id in list(self._servicios_por_equipo.pop(equipo_id, ())):
+            self._quitar_servicio(servicio_id)
+        equipo = self.equipos.pop(equipo_id, None)
+        if equipo is None:
+            return False
+        self._desindexar_equipo(equipo)
+        return True
+
+    async def garantias_por_vencer(self, desde: date, hasta: date, skip: int, limit: int,
+                                   campos: Optional[List[str]] = None) -> List[dict]:
+        inicio = bisect.bisect_left(self._garantias, (desde.isoformat(),)) + skip
+        fin = bisect.bisect_left(self._garantias, ((hasta + timedelta(days=1)).isoformat(),))
+        return [
+            _proyectar(self.equipos[equipo_id], campos)
+            for _, equipo_id in self._garantias[inicio:min(fin, inicio + limit)]
+        ]
+
+    # ---------- servicios ----------
+
+    async def buscar_servicios(self, desde: Optional[date] = None, hasta: Optional[date] = None,
+                               equipo_id: Optional[str] = None, campos: Optional[List[str]] = None) -> List[dict]:
+        if equipo_id is not None:
+            servicios = [self.servicios[servicio_id] for servicio_id in self._servicios_por_equipo.get(equipo_id, ())]
+            servicios = [
+                servicio for servicio in servicios
+                if (not desde or servicio["fecha_programada"] >= desde.isoformat())
+                and (not hasta or servicio["fecha_programada"] < hasta.isoformat())
+            ]
+        else:
+            servicios = self._servicios_en_rango(desde, hasta)
+        return [_proyectar(servicio, campos) for servicio in servicios]
+
+    async def proximos_servicios(self, desde: date, limite: int) -> List[dict]:
+        return [dict(servicio) for servicio in self._servicios_en_rango(desde, None)[:limite]]
+
+    async def servicios_vencidos(self, antes_de: date, skip: int, limit: int,
+                                 campos: Optional[List[str]] = None) -> List[dict]:
+        fin = bisect.bisect_left(self._pendientes_por_fecha, (antes_de.isoformat(),))
+        return [
+            _proyectar(self.servicios[servicio_id], campos)
+            for _, servicio_id in self._pendientes_por_fecha[skip:min(fin, skip + limit)]
+        ]
+
+    async def ocupacion_por_dia(self, desde: date, hasta: date) -> Dict[date, int]:
+        ocupacion = {}
+        dia = desde
+        while dia < hasta:
+            if dia.isoformat() in self._ocupacion:
+                ocupacion[dia] = self._ocupacion[dia.isoformat()]
+            dia += timedelta(days=1)
+        return ocupacion
+
+    async def insertar_servicios(self, servicios: List[dict]):
+        for servicio in servicios:
+            self.servicios[servicio["id"]] = dict(servicio)
+            self._servicios_por_equipo[servicio["equipo_id"]].add(servicio["id"])
+            bisect.insort(self._servicios_por_fecha, (servicio["fecha_programada"], servicio["id"]))
+            if not servicio["autorizado"]:
+                bisect.insort(self._pendientes_por_fecha, (servicio["fecha_programada"], servicio["id"]))
+            self._ocupacion[servicio["fecha_programada"]] += 1
+
+    async def eliminar_servicios_pendientes(self, equipo_id: str):
+        for servicio_id in list(self._servicios_por_equipo.get(equipo_id, ())):
+            if not self.servicios[servicio_id]["autorizado"]:
+                self._quitar_servicio(servicio_id)
+
+    async def autorizar_servicio(self, servicio_id: str, autorizado: bool) -> bool:
+        servicio = self.servicios.get(servicio_id)
+        if servicio is None:
+            return False
+        if servicio["autorizado"] != autorizado:
+            clave = (servicio["fecha_programada"], servicio_id)
+            if autorizado:
+                del self._pendientes_por_fecha[bisect.bisect_left(self._pendientes_por_fecha, clave)]
+            else:
+                bisect.insort(self._pendientes_por_fecha, clave)
+            servicio["autorizado"] = autorizado
+        return True
+
+    async def archivar_servicios(self, corte: date, lote: int) -> int:
+        return 0
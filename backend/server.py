@@ -1,31 +1,71 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, field_validator
+from typing import Dict, List, Optional
 import uuid
-from datetime import datetime, timezone, date
+from datetime import datetime, timezone, date, timedelta
 from dateutil.relativedelta import relativedelta
 from fastapi import UploadFile, File
 from io import BytesIO
 import openpyxl
 
+from almacenamiento import a_uuid
+from repositorios import Repositorio, crear_repositorio
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Servicios autorizados con fecha anterior a hoy - ARCHIVO_DIAS pasan a servicios_historico
+ARCHIVO_DIAS = int(os.environ.get('ARCHIVO_DIAS', '365'))
+ARCHIVO_INTERVALO_HORAS = float(os.environ.get('ARCHIVO_INTERVALO_HORAS', '24'))  # 0 desactiva la tarea
+ARCHIVO_LOTE = int(os.environ.get('ARCHIVO_LOTE', '500'))
+
+# Planificación por capacidad: máximo de servicios por día (0 = sin límite, se respeta el día
+# de fecha_primer_servicio) y cuántos días se puede adelantar o atrasar cada servicio.
+# La tolerancia se limita por equipo a menos de la mitad de su intervalo más corto
+# (13 días para mensual): con más, un servicio desplazado taparía el del periodo vecino
+CAPACIDAD_DIARIA = int(os.environ.get('CAPACIDAD_DIARIA', '0'))
+TOLERANCIA_DIAS = int(os.environ.get('TOLERANCIA_DIAS', '3'))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # El repositorio se crea al arrancar (REPOSITORIO=mongo|memoria); los índices se crean
+    # en segundo plano para que el arranque no espere a la base de datos
+    repo = crear_repositorio()
+    app.state.repositorio = repo
+    app.state.planificacion = asyncio.Lock()
+    tareas = [asyncio.create_task(iniciar_repositorio(repo))]
+    if ARCHIVO_INTERVALO_HORAS > 0:
+        tareas.append(asyncio.create_task(tarea_archivo()))
+    try:
+        yield
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+        await repo.cerrar()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # ==================== MODELOS ====================
 
+def validar_fecha(valor: Optional[str]) -> Optional[str]:
+    """Las fechas de la API son YYYY-MM-DD; un texto vacío equivale a no indicar fecha"""
+    if not valor:
+        return None
+    try:
+        return date.fromisoformat(valor).isoformat()
+    except ValueError:
+        raise ValueError("Debe ser una fecha con formato YYYY-MM-DD")
+
 class ClienteBase(BaseModel):
     nombre: str
 
@@ -47,7 +87,12 @@ class EquipoBase(BaseModel):
     confirmado: bool = True  # False para equipos importados pendientes de configurar
 
 class EquipoCreate(EquipoBase):
-    pass
+    # Las fechas se validan solo al recibirlas: un equipo guardado con una fecha antigua
+    # mal escrita se sigue pudiendo listar y corregir
+    @field_validator("fecha_primer_servicio", "fecha_fin_garantia")
+    @classmethod
+    def validar_fechas(cls, valor: Optional[str]) -> Optional[str]:
+        return validar_fecha(valor)
 
 class Equipo(EquipoBase):
     model_config = ConfigDict(extra="ignore")
@@ -98,6 +143,115 @@ def calcular_proximas_fechas(fecha_inicio: date, periodicidad: str, meses_adelan
     
     return fechas
 
+def balancear_fechas(fechas: List[date], ocupacion: Dict[date, int], capacidad: int, tolerancia: int,
+                     minima: Optional[date] = None) -> List[date]:
+    """Mueve cada fecha al día más cercano (dentro de ±tolerancia días) con menos de `capacidad` servicios.
+    Si toda la ventana está llena usa el día menos cargado. Actualiza `ocupacion` con lo asignado,
+    así que cada fecha cuesta O(tolerancia) sin volver a consultar los servicios.
+    Ninguna fecha se adelanta a `minima` (fecha_primer_servicio).
+    """
+    resultado = []
+    for fecha in fechas:
+        candidatos = [fecha]
+        for dias in range(1, tolerancia + 1):
+            candidatos += [fecha + timedelta(days=dias), fecha - timedelta(days=dias)]
+        if minima is not None:
+            candidatos = [dia for dia in candidatos if dia >= minima] or [fecha]
+        elegida = next((dia for dia in candidatos if ocupacion.get(dia, 0) < capacidad), None)
+        if elegida is None:
+            elegida = min(candidatos, key=lambda dia: ocupacion.get(dia, 0))
+        ocupacion[elegida] = ocupacion.get(elegida, 0) + 1
+        resultado.append(elegida)
+    return resultado
+
+# Campos de ServicioDetalle que salen del equipo (nombre en ServicioDetalle -> nombre en equipos)
+CAMPOS_EQUIPO_DETALLE = {
+    "equipo_modelo": "modelo",
+    "equipo_numero_serie": "numero_serie",
+    "cliente_id": "cliente_id",
+    "en_garantia": "en_garantia",
+}
+
+def validar_id(valor: str, detalle: str) -> str:
+    """Un id que no es un UUID no puede existir: 404 sin llegar a consultar el repositorio"""
+    if a_uuid(valor) is None:
+        raise HTTPException(status_code=404, detail=detalle)
+    return valor
+
+def parse_fields(fields: Optional[str], modelo: type[BaseModel]) -> Optional[List[str]]:
+    """Convierte el parámetro fields= en la lista de campos pedidos (None = todos los campos)"""
+    if not fields:
+        return None
+    campos = [campo.strip() for campo in fields.split(",") if campo.strip()]
+    if not campos:
+        raise HTTPException(status_code=400, detail="El parámetro fields no indica ningún campo")
+    invalidos = [campo for campo in campos if campo not in modelo.model_fields]
+    if invalidos:
+        raise HTTPException(status_code=400, detail=f"Campos no válidos: {', '.join(invalidos)}")
+    return campos
+
+def respuesta_parcial(campos: Optional[List[str]], datos: list):
+    """Con fields= se devuelve el JSON tal cual, sin validar contra el modelo completo"""
+    if campos is None:
+        return datos
+    return JSONResponse(content=datos)
+
+async def construir_detalles(servicios: List[dict], campos: Optional[List[str]] = None) -> List[dict]:
+    """Une servicios con su equipo y cliente trayendo solo lo necesario para los campos pedidos.
+    Los equipos y clientes se leen con una consulta cada uno en lugar de una por servicio.
+    """
+    campos = campos or list(ServicioDetalle.model_fields)
+    
+    campos_equipo = {CAMPOS_EQUIPO_DETALLE[campo] for campo in campos if campo in CAMPOS_EQUIPO_DETALLE}
+    if "cliente_nombre" in campos:
+        campos_equipo.add("cliente_id")
+    
+    equipos = await repositorio().obtener_equipos(
+        {servicio["equipo_id"] for servicio in servicios},
+        sorted(campos_equipo) or ["id"]
+    )
+    
+    clientes = {}
+    if "cliente_nombre" in campos:
+        clientes = await repositorio().nombres_clientes(
+            {equipo["cliente_id"] for equipo in equipos.values() if equipo.get("cliente_id")}
+        )
+    
+    resultado = []
+    for servicio in servicios:
+        equipo = equipos.get(servicio["equipo_id"])
+        if not equipo:
+            continue
+        detalle = {
+            "id": servicio.get("id"),
+            "equipo_id": servicio["equipo_id"],
+            "fecha_programada": servicio.get("fecha_programada"),
+            "autorizado": servicio.get("autorizado"),
+            "equipo_modelo": equipo.get("modelo"),
+            "equipo_numero_serie": equipo.get("numero_serie"),
+            "cliente_nombre": clientes.get(equipo.get("cliente_id"), "Desconocido"),
+            "cliente_id": equipo.get("cliente_id"),
+            "en_garantia": equipo.get("en_garantia", False),
+        }
+        resultado.append({campo: detalle[campo] for campo in campos})
+    
+    return resultado
+
+def campos_servicios(campos: Optional[List[str]]) -> Optional[List[str]]:
+    """Campos de servicios a leer para un listado de ServicioDetalle (equipo_id siempre hace falta para el join)"""
+    if campos is None:
+        return None
+    return [campo for campo in campos if campo in Servicio.model_fields] + ["equipo_id"]
+
+def repositorio() -> Repositorio:
+    return app.state.repositorio
+
+async def iniciar_repositorio(repo: Repositorio):
+    try:
+        await repo.iniciar()
+    except Exception:
+        logger.exception("Error al preparar el repositorio")
+
 # ==================== ENDPOINTS CLIENTES ====================
 
 @api_router.get("/")
@@ -106,56 +260,70 @@ async def root():
 
 @api_router.get("/clientes", response_model=List[Cliente])
 async def get_clientes():
-    clientes = await db.clientes.find({}, {"_id": 0}).to_list(1000)
-    return clientes
+    return await repositorio().listar_clientes()
 
 @api_router.post("/clientes", response_model=Cliente)
 async def create_cliente(cliente: ClienteCreate):
     cliente_obj = Cliente(**cliente.model_dump())
-    doc = cliente_obj.model_dump()
-    await db.clientes.insert_one(doc)
+    await repositorio().insertar_cliente(cliente_obj.model_dump())
     return cliente_obj
 
 @api_router.put("/clientes/{cliente_id}", response_model=Cliente)
 async def update_cliente(cliente_id: str, cliente: ClienteCreate):
-    result = await db.clientes.update_one(
-        {"id": cliente_id},
-        {"$set": cliente.model_dump()}
-    )
-    if result.matched_count == 0:
+    validar_id(cliente_id, "Cliente no encontrado")
+    updated = await repositorio().actualizar_cliente(cliente_id, cliente.model_dump())
+    if updated is None:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
-    updated = await db.clientes.find_one({"id": cliente_id}, {"_id": 0})
     return updated
 
 @api_router.delete("/clientes/{cliente_id}")
-async def delete_cliente(cliente_id: str):
+async def delete_cliente(cliente_id: str, cascade: bool = False):
+    validar_id(cliente_id, "Cliente no encontrado")
+    if cascade:
+        # Cliente, equipos y servicios con un número fijo de operaciones (en transacción si es posible)
+        eliminados = await repositorio().eliminar_cliente_cascada(cliente_id)
+        if eliminados is None:
+            raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        return {"message": "Cliente eliminado", "eliminados": eliminados}
+    
     # Verificar si hay equipos asociados
-    equipos = await db.equipos.find_one({"cliente_id": cliente_id})
-    if equipos:
+    if await repositorio().cliente_tiene_equipos(cliente_id):
         raise HTTPException(status_code=400, detail="No se puede eliminar el cliente porque tiene equipos asociados")
-    result = await db.clientes.delete_one({"id": cliente_id})
-    if result.deleted_count == 0:
+    if not await repositorio().eliminar_cliente(cliente_id):
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
     return {"message": "Cliente eliminado"}
 
 # ==================== ENDPOINTS EQUIPOS ====================
 
 @api_router.get("/equipos", response_model=List[Equipo])
-async def get_equipos():
-    equipos = await db.equipos.find({}, {"_id": 0}).to_list(1000)
-    return equipos
+async def get_equipos(fields: Optional[str] = None):
+    campos = parse_fields(fields, Equipo)
+    return respuesta_parcial(campos, await repositorio().listar_equipos(campos))
+
+@api_router.get("/equipos/garantias-por-vencer", response_model=List[Equipo])
+async def get_garantias_por_vencer(
+    dias: int = Query(30, ge=0, le=3650),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    fields: Optional[str] = None
+):
+    """Equipos en garantía cuya fecha_fin_garantia cae entre hoy y hoy + dias (índice parcial en_garantia=True)"""
+    campos = parse_fields(fields, Equipo)
+    hoy = date.today()
+    equipos = await repositorio().garantias_por_vencer(hoy, hoy + timedelta(days=dias), skip, limit, campos)
+    return respuesta_parcial(campos, equipos)
 
 @api_router.post("/equipos", response_model=Equipo)
 async def create_equipo(equipo: EquipoCreate):
     # Verificar que el cliente existe si se proporciona
     if equipo.cliente_id:
-        cliente = await db.clientes.find_one({"id": equipo.cliente_id})
+        validar_id(equipo.cliente_id, "Cliente no encontrado")
+        cliente = await repositorio().obtener_cliente(equipo.cliente_id)
         if not cliente:
             raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
     equipo_obj = Equipo(**equipo.model_dump())
-    doc = equipo_obj.model_dump()
-    await db.equipos.insert_one(doc)
+    await repositorio().insertar_equipo(equipo_obj.model_dump())
     
     # Solo generar servicios si está confirmado y tiene cliente
     if equipo_obj.confirmado and equipo_obj.cliente_id and equipo_obj.periodicidad and equipo_obj.fecha_primer_servicio:
@@ -165,26 +333,24 @@ async def create_equipo(equipo: EquipoCreate):
 
 @api_router.put("/equipos/{equipo_id}", response_model=Equipo)
 async def update_equipo(equipo_id: str, equipo: EquipoCreate):
+    validar_id(equipo_id, "Equipo no encontrado")
     # Verificar que el cliente existe si se proporciona
     if equipo.cliente_id:
-        cliente = await db.clientes.find_one({"id": equipo.cliente_id})
+        validar_id(equipo.cliente_id, "Cliente no encontrado")
+        cliente = await repositorio().obtener_cliente(equipo.cliente_id)
         if not cliente:
             raise HTTPException(status_code=404, detail="Cliente no encontrado")
     
-    result = await db.equipos.update_one(
-        {"id": equipo_id},
-        {"$set": equipo.model_dump()}
-    )
-    if result.matched_count == 0:
+    updated = await repositorio().actualizar_equipo(equipo_id, equipo.model_dump())
+    if updated is None:
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     
-    updated = await db.equipos.find_one({"id": equipo_id}, {"_id": 0})
     equipo_updated = Equipo(**updated)
     
     # Solo regenerar servicios si está confirmado y tiene todos los datos necesarios
     if equipo_updated.confirmado and equipo_updated.cliente_id and equipo_updated.periodicidad and equipo_updated.fecha_primer_servicio:
         # Eliminar servicios no autorizados y regenerar
-        await db.servicios.delete_many({"equipo_id": equipo_id, "autorizado": False})
+        await repositorio().eliminar_servicios_pendientes(equipo_id)
         await generar_servicios_equipo(equipo_updated)
     
     return updated
@@ -240,8 +406,7 @@ async def importar_equipos(file: UploadFile = File(...)):
                     continue  # Saltar filas vacías
                 
                 # Verificar si ya existe un equipo con ese número de serie
-                existente = await db.equipos.find_one({"numero_serie": numero_serie})
-                if existente:
+                if await repositorio().existe_numero_serie(numero_serie):
                     errores.append(f"Fila {row_num}: Número de serie '{numero_serie}' ya existe")
                     continue
                 
@@ -256,7 +421,7 @@ async def importar_equipos(file: UploadFile = File(...)):
                     fecha_fin_garantia=None,
                     confirmado=False
                 )
-                await db.equipos.insert_one(equipo_obj.model_dump())
+                await repositorio().insertar_equipo(equipo_obj.model_dump())
                 importados += 1
                 
             except Exception as e:
@@ -269,10 +434,9 @@ async def importar_equipos(file: UploadFile = File(...)):
 
 @api_router.delete("/equipos/{equipo_id}")
 async def delete_equipo(equipo_id: str):
-    # Eliminar servicios asociados
-    await db.servicios.delete_many({"equipo_id": equipo_id})
-    result = await db.equipos.delete_one({"id": equipo_id})
-    if result.deleted_count == 0:
+    validar_id(equipo_id, "Equipo no encontrado")
+    # Elimina también los servicios asociados
+    if not await repositorio().eliminar_equipo(equipo_id):
         raise HTTPException(status_code=404, detail="Equipo no encontrado")
     return {"message": "Equipo eliminado"}
 
@@ -285,115 +449,104 @@ async def generar_servicios_equipo(equipo: Equipo):
         fecha_inicio = datetime.fromisoformat(equipo.fecha_creacion).date()
     fechas = calcular_proximas_fechas(fecha_inicio, equipo.periodicidad)
     
-    for fecha in fechas:
-        # Verificar si ya existe un servicio para esta fecha
-        existente = await db.servicios.find_one({
-            "equipo_id": equipo.id,
-            "fecha_programada": fecha.isoformat()
-        })
-        if not existente:
-            servicio = Servicio(
-                equipo_id=equipo.id,
-                fecha_programada=fecha.isoformat(),
-                autorizado=False
+    # Con planificación por capacidad un servicio ya existente puede estar desplazado
+    # hasta TOLERANCIA_DIAS respecto de la fecha calculada, sin llegar a la mitad del intervalo
+    tolerancia = 0
+    if CAPACIDAD_DIARIA > 0:
+        intervalo = min((siguiente - fecha).days for fecha, siguiente in zip(fechas, fechas[1:]))
+        tolerancia = min(TOLERANCIA_DIAS, (intervalo - 1) // 2)
+    
+    # Fechas que ya tienen servicio (incluido el histórico si las fechas llegan hasta él)
+    existentes = await repositorio().buscar_servicios(
+        desde=fechas[0] - timedelta(days=tolerancia), equipo_id=equipo.id, campos=["fecha_programada"]
+    )
+    ocupadas = [date.fromisoformat(servicio["fecha_programada"]) for servicio in existentes]
+    fechas = [
+        fecha for fecha in fechas
+        if not any(abs((fecha - ocupada).days) <= tolerancia for ocupada in ocupadas)
+    ]
+    if not fechas:
+        return
+    
+    # Leer la ocupación y guardar los servicios sin que otra alta del mismo proceso lea entre medias;
+    # con varios procesos dos altas simultáneas aún pueden pasarse de la capacidad de un día
+    async with app.state.planificacion:
+        if CAPACIDAD_DIARIA > 0:
+            # Contadores por día ya calculados: cuesta O(días del horizonte), no O(servicios)
+            ocupacion = await repositorio().ocupacion_por_dia(
+                fechas[0] - timedelta(days=tolerancia), fechas[-1] + timedelta(days=tolerancia + 1)
             )
-            await db.servicios.insert_one(servicio.model_dump())
+            fechas = balancear_fechas(fechas, ocupacion, CAPACIDAD_DIARIA, tolerancia, minima=fecha_inicio)
+        
+        nuevos = [
+            Servicio(equipo_id=equipo.id, fecha_programada=fecha.isoformat(), autorizado=False).model_dump()
+            for fecha in fechas
+        ]
+        await repositorio().insertar_servicios(nuevos)
+
+# ==================== ARCHIVO HISTÓRICO ====================
+
+async def tarea_archivo():
+    """Archiva periódicamente los servicios antiguos"""
+    while True:
+        try:
+            corte = date.today() - timedelta(days=ARCHIVO_DIAS)
+            movidos = await repositorio().archivar_servicios(corte, ARCHIVO_LOTE)
+            if movidos:
+                logger.info(f"Archivados {movidos} servicios en servicios_historico")
+        except Exception:
+            logger.exception("Error al archivar servicios")
+        await asyncio.sleep(ARCHIVO_INTERVALO_HORAS * 3600)
 
 # ==================== ENDPOINTS SERVICIOS ====================
 
 @api_router.get("/servicios", response_model=List[ServicioDetalle])
-async def get_servicios():
-    servicios = await db.servicios.find({}, {"_id": 0}).to_list(10000)
-    resultado = []
-    
-    for servicio in servicios:
-        equipo = await db.equipos.find_one({"id": servicio["equipo_id"]}, {"_id": 0})
-        if equipo:
-            cliente = await db.clientes.find_one({"id": equipo["cliente_id"]}, {"_id": 0})
-            resultado.append(ServicioDetalle(
-                id=servicio["id"],
-                equipo_id=servicio["equipo_id"],
-                fecha_programada=servicio["fecha_programada"],
-                autorizado=servicio["autorizado"],
-                equipo_modelo=equipo["modelo"],
-                equipo_numero_serie=equipo["numero_serie"],
-                cliente_nombre=cliente["nombre"] if cliente else "Desconocido",
-                cliente_id=equipo["cliente_id"],
-                en_garantia=equipo.get("en_garantia", False)
-            ))
-    
-    return resultado
+async def get_servicios(fields: Optional[str] = None, desde: Optional[date] = None, hasta: Optional[date] = None):
+    """Servicios con fecha_programada en [desde, hasta) si se indican"""
+    campos = parse_fields(fields, ServicioDetalle)
+    servicios = await repositorio().buscar_servicios(desde=desde, hasta=hasta, campos=campos_servicios(campos))
+    return respuesta_parcial(campos, await construir_detalles(servicios, campos))
 
 @api_router.get("/servicios/proximos", response_model=List[ServicioDetalle])
 async def get_proximos_servicios():
-    """Obtiene los próximos 20 servicios ordenados por fecha"""
-    hoy = date.today().isoformat()
-    servicios = await db.servicios.find(
-        {"fecha_programada": {"$gte": hoy}},
-        {"_id": 0}
-    ).sort("fecha_programada", 1).to_list(20)
+    """Obtiene los próximos 20 servicios ordenados por fecha (nunca están en el histórico)"""
+    servicios = await repositorio().proximos_servicios(date.today(), 20)
     
-    resultado = []
-    for servicio in servicios:
-        equipo = await db.equipos.find_one({"id": servicio["equipo_id"]}, {"_id": 0})
-        if equipo:
-            cliente = await db.clientes.find_one({"id": equipo["cliente_id"]}, {"_id": 0})
-            resultado.append(ServicioDetalle(
-                id=servicio["id"],
-                equipo_id=servicio["equipo_id"],
-                fecha_programada=servicio["fecha_programada"],
-                autorizado=servicio["autorizado"],
-                equipo_modelo=equipo["modelo"],
-                equipo_numero_serie=equipo["numero_serie"],
-                cliente_nombre=cliente["nombre"] if cliente else "Desconocido",
-                cliente_id=equipo["cliente_id"],
-                en_garantia=equipo.get("en_garantia", False)
-            ))
-    
-    return resultado
+    return await construir_detalles(servicios)
+
+@api_router.get("/servicios/vencidos", response_model=List[ServicioDetalle])
+async def get_servicios_vencidos(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    fields: Optional[str] = None
+):
+    """Servicios pasados que nunca se autorizaron, del más antiguo al más reciente (índice parcial autorizado=False)"""
+    campos = parse_fields(fields, ServicioDetalle)
+    servicios = await repositorio().servicios_vencidos(date.today(), skip, limit, campos_servicios(campos))
+    return respuesta_parcial(campos, await construir_detalles(servicios, campos))
 
 @api_router.put("/servicios/{servicio_id}/autorizar")
 async def autorizar_servicio(servicio_id: str, autorizado: bool = True):
-    result = await db.servicios.update_one(
-        {"id": servicio_id},
-        {"$set": {"autorizado": autorizado}}
-    )
-    if result.matched_count == 0:
+    validar_id(servicio_id, "Servicio no encontrado")
+    if not await repositorio().autorizar_servicio(servicio_id, autorizado):
         raise HTTPException(status_code=404, detail="Servicio no encontrado")
     return {"message": "Servicio actualizado", "autorizado": autorizado}
 
 @api_router.get("/calendario/{anio}/{mes}", response_model=List[ServicioDetalle])
-async def get_calendario_mes(anio: int, mes: int):
+async def get_calendario_mes(anio: int, mes: int, fields: Optional[str] = None):
     """Obtiene los servicios de un mes específico"""
-    fecha_inicio = date(anio, mes, 1).isoformat()
+    campos = parse_fields(fields, ServicioDetalle)
+    fecha_inicio = date(anio, mes, 1)
     if mes == 12:
-        fecha_fin = date(anio + 1, 1, 1).isoformat()
+        fecha_fin = date(anio + 1, 1, 1)
     else:
-        fecha_fin = date(anio, mes + 1, 1).isoformat()
-    
-    servicios = await db.servicios.find(
-        {"fecha_programada": {"$gte": fecha_inicio, "$lt": fecha_fin}},
-        {"_id": 0}
-    ).to_list(1000)
+        fecha_fin = date(anio, mes + 1, 1)
     
-    resultado = []
-    for servicio in servicios:
-        equipo = await db.equipos.find_one({"id": servicio["equipo_id"]}, {"_id": 0})
-        if equipo:
-            cliente = await db.clientes.find_one({"id": equipo["cliente_id"]}, {"_id": 0})
-            resultado.append(ServicioDetalle(
-                id=servicio["id"],
-                equipo_id=servicio["equipo_id"],
-                fecha_programada=servicio["fecha_programada"],
-                autorizado=servicio["autorizado"],
-                equipo_modelo=equipo["modelo"],
-                equipo_numero_serie=equipo["numero_serie"],
-                cliente_nombre=cliente["nombre"] if cliente else "Desconocido",
-                cliente_id=equipo["cliente_id"],
-                en_garantia=equipo.get("en_garantia", False)
-            ))
+    servicios = await repositorio().buscar_servicios(
+        desde=fecha_inicio, hasta=fecha_fin, campos=campos_servicios(campos)
+    )
     
-    return resultado
+    return respuesta_parcial(campos, await construir_detalles(servicios, campos))
 
 # Include router
 app.include_router(api_router)
@@ -406,12 +559,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Comprime respuestas grandes (listados de servicios/equipos) para sedes con enlaces lentos
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+def crear_cliente(client, nombre="Hospital San Juan"):
+    return client.post("/api/clientes", json={"nombre": nombre}).json()
+
+
+def crear_equipo(client, cliente_id, **extra):
+    datos = {
+        "modelo": "Monitor MSV-2024",
+        "numero_serie": "MSV-001",
+        "cliente_id": cliente_id,
+        "periodicidad": "trimestral",
+        "fecha_primer_servicio": "2026-01-15",
+        **extra,
+    }
+    return client.post("/api/equipos", json=datos).json()
+
+
+def datos_equipo(equipo: dict) -> dict:
+    """Cuerpo para PUT /api/equipos/{id} a partir de un equipo devuelto por la API"""
+    return {k: v for k, v in equipo.items() if k not in ("id", "fecha_creacion")}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """API contra el repositorio en memoria, sin la tarea de archivo"""
+    monkeypatch.setenv("REPOSITORIO", "memoria")
+    monkeypatch.setattr(server, "ARCHIVO_INTERVALO_HORAS", 0)
+    with TestClient(server.app) as c:
+        yield c
+
+
+@pytest.fixture
+def client_mongo(monkeypatch):
+    """API contra RepositorioMotor sobre mongomock-motor (sin mongod ni transacciones)"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import mongomock.collection
+    import repositorios
+
+    # mongomock valida los documentos sin las codec options del cliente y rechaza los
+    # UUID nativos aunque se haya pedido uuidRepresentation="standard"
+    monkeypatch.setattr(mongomock.collection, "BSON", None)
+    monkeypatch.setattr(
+        repositorios, "AsyncIOMotorClient",
+        lambda url, **kwargs: mongomock_motor.AsyncMongoMockClient(url, **kwargs)
+    )
+    monkeypatch.setenv("REPOSITORIO", "mongo")
+    monkeypatch.setenv("MONGO_URL", "mongodb://localhost")
+    monkeypatch.setenv("DB_NAME", "serviagenda_test")
+    monkeypatch.setattr(server, "ARCHIVO_INTERVALO_HORAS", 0)
+    with TestClient(server.app) as c:
+        server.app.state.repositorio._replica_set = False
+        yield c
@@ -0,0 +1,66 @@
+"""Tests de la conversión entre el formato de la API y el formato almacenado"""
+import uuid
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from almacenamiento import a_bson, a_uuid, desde_bson, proyeccion_bson
+
+SERVICIO = {
+    "id": "b4b3498f-1c07-4e8d-bb73-cbf696a0a394",
+    "equipo_id": "4194625b-3876-43a6-8569-f81ec6218203",
+    "fecha_programada": "2026-10-05",
+    "autorizado": False,
+}
+
+
+def test_servicio_ida_y_vuelta():
+    doc = a_bson(SERVICIO)
+    assert doc["_id"] == uuid.UUID(SERVICIO["id"])
+    assert "id" not in doc
+    assert doc["equipo_id"] == uuid.UUID(SERVICIO["equipo_id"])
+    assert doc["fecha_programada"] == datetime(2026, 10, 5, tzinfo=timezone.utc)
+    assert desde_bson(doc) == SERVICIO
+
+
+def test_equipo_con_fechas_opcionales_y_sin_cliente():
+    equipo = {
+        "id": "4194625b-3876-43a6-8569-f81ec6218203",
+        "modelo": "Monitor",
+        "cliente_id": None,
+        "fecha_primer_servicio": "2026-01-31",
+        "fecha_fin_garantia": None,
+        "fecha_creacion": "2026-10-19T04:06:44.738379+00:00",
+    }
+    doc = a_bson(equipo)
+    assert doc["cliente_id"] is None
+    assert doc["fecha_fin_garantia"] is None
+    assert desde_bson(doc) == equipo
+
+
+def test_fecha_creacion_pierde_los_microsegundos_como_bson():
+    doc = a_bson({"fecha_creacion": "2026-10-19T04:06:44.738379+00:00"})
+    # Mongo guarda milisegundos: así vuelve un Date leído con tz_aware=True
+    leido = doc["fecha_creacion"].replace(microsecond=738000)
+    assert desde_bson({"fecha_creacion": leido}) == {"fecha_creacion": "2026-10-19T04:06:44.738000+00:00"}
+
+
+def test_fecha_sin_zona_se_interpreta_en_utc():
+    doc = a_bson({"fecha_creacion": "2026-10-19T04:06:44"})
+    assert doc["fecha_creacion"].tzinfo == timezone.utc
+
+
+def test_documento_sin_migrar():
+    viejo = {"_id": ObjectId(), **SERVICIO}
+    assert desde_bson(viejo) == SERVICIO
+
+
+def test_ids_mal_formados():
+    assert a_uuid("no-es-un-uuid") is None
+    assert a_uuid(None) is None
+    assert a_bson({"cliente_id": "no-es-un-uuid"}) == {"cliente_id": None}
+
+
+def test_proyeccion():
+    assert proyeccion_bson(["id", "nombre"]) == {"_id": 1, "nombre": 1}
+    assert proyeccion_bson(["nombre"]) == {"nombre": 1, "_id": 0}
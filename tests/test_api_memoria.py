@@ -0,0 +1,198 @@
+"""Tests de la API contra el repositorio en memoria (no necesitan MongoDB)"""
+from datetime import date, timedelta
+
+import pytest
+
+import server
+from tests.conftest import crear_cliente, crear_equipo, datos_equipo
+
+
+def test_crear_equipo_genera_servicios(client):
+    cliente = crear_cliente(client)
+    equipo = crear_equipo(client, cliente["id"])
+
+    servicios = client.get("/api/servicios").json()
+    # 24 meses trimestrales desde la primera fecha, ambos extremos incluidos
+    assert len(servicios) == 9
+    assert {s["equipo_id"] for s in servicios} == {equipo["id"]}
+    assert servicios[0]["cliente_nombre"] == "Hospital San Juan"
+
+
+def test_actualizar_equipo_no_duplica_servicios_autorizados(client):
+    cliente = crear_cliente(client)
+    equipo = crear_equipo(client, cliente["id"])
+    primero = client.get("/api/servicios").json()[0]
+    client.put(f"/api/servicios/{primero['id']}/autorizar", params={"autorizado": "true"})
+
+    assert client.put(f"/api/equipos/{equipo['id']}", json=datos_equipo(equipo)).status_code == 200
+
+    servicios = client.get("/api/servicios").json()
+    assert len(servicios) == 9
+    assert [s["autorizado"] for s in servicios if s["id"] == primero["id"]] == [True]
+
+
+def test_fields_devuelve_solo_los_campos_pedidos(client):
+    cliente = crear_cliente(client)
+    crear_equipo(client, cliente["id"])
+
+    servicios = client.get("/api/calendario/2026/4", params={"fields": "fecha_programada,cliente_nombre"}).json()
+    assert servicios == [{"fecha_programada": "2026-04-15", "cliente_nombre": "Hospital San Juan"}]
+    assert client.get("/api/equipos", params={"fields": "id,inexistente"}).status_code == 400
+
+
+def test_fields_en_equipos_y_servicios(client):
+    cliente = crear_cliente(client)
+    equipo = crear_equipo(client, cliente["id"])
+
+    assert client.get("/api/equipos", params={"fields": "id,modelo"}).json() == [
+        {"id": equipo["id"], "modelo": "Monitor MSV-2024"}
+    ]
+    servicios = client.get("/api/servicios", params={"fields": "id, autorizado"}).json()
+    assert len(servicios) == 9
+    assert all(set(servicio) == {"id", "autorizado"} for servicio in servicios)
+    assert client.get("/api/equipos", params={"fields": ",,"}).status_code == 400
+    assert client.get("/api/servicios", params={"fields": " , "}).status_code == 400
+
+
+def test_respuestas_grandes_comprimidas(client):
+    cliente = crear_cliente(client)
+    for i in range(5):
+        crear_equipo(client, cliente["id"], numero_serie=f"MSV-{i}", periodicidad="mensual")
+
+    respuesta = client.get("/api/servicios", headers={"Accept-Encoding": "gzip"})
+    assert respuesta.headers["content-encoding"] == "gzip"
+    assert len(respuesta.json()) == 125
+    pequena = client.get("/api/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in pequena.headers
+
+
+@pytest.mark.parametrize("backend", ["client", "client_mongo"])
+def test_eliminar_cliente_con_equipos(backend, request):
+    client = request.getfixturevalue(backend)
+    cliente = crear_cliente(client)
+    crear_equipo(client, cliente["id"])
+
+    assert client.delete(f"/api/clientes/{cliente['id']}").status_code == 400
+
+    respuesta = client.delete(f"/api/clientes/{cliente['id']}", params={"cascade": "true"}).json()
+    assert respuesta["eliminados"]["equipos"] == 1
+    assert respuesta["eliminados"]["servicios"] == 9
+    assert client.get("/api/servicios").json() == []
+    assert client.delete(f"/api/clientes/{cliente['id']}", params={"cascade": "true"}).status_code == 404
+
+
+def test_eliminar_cliente_en_cascada_usa_with_transaction(client_mongo, monkeypatch):
+    repo = server.app.state.repositorio
+    cliente = crear_cliente(client_mongo)
+    crear_equipo(client_mongo, cliente["id"])
+
+    class SesionFalsa:
+        """mongomock no admite sesiones: la transacción ejecuta la función sin sesión"""
+        intentos = 0
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        async def with_transaction(self, funcion):
+            SesionFalsa.intentos += 1
+            return await funcion(None)
+
+    async def start_session():
+        return SesionFalsa()
+
+    repo._replica_set = True
+    monkeypatch.setattr(repo.client, "start_session", start_session)
+
+    respuesta = client_mongo.delete(f"/api/clientes/{cliente['id']}", params={"cascade": "true"})
+    assert respuesta.json()["eliminados"] == {"clientes": 1, "equipos": 1, "servicios": 9, "servicios_historico": 0}
+    assert SesionFalsa.intentos == 1
+    assert client_mongo.delete(f"/api/clientes/{cliente['id']}", params={"cascade": "true"}).status_code == 404
+
+
+@pytest.mark.parametrize("backend", ["client", "client_mongo"])
+def test_servicios_vencidos_y_garantias(backend, request):
+    client = request.getfixturevalue(backend)
+    cliente = crear_cliente(client)
+    crear_equipo(client, cliente["id"], fecha_primer_servicio="2020-01-01", periodicidad="anual",
+                 en_garantia=True, fecha_fin_garantia="2099-01-01")
+
+    def vencidos(**params):
+        return [s["fecha_programada"] for s in client.get("/api/servicios/vencidos", params=params).json()]
+
+    assert vencidos(limit=2) == ["2020-01-01", "2021-01-01"]
+    primero = client.get("/api/servicios").json()[0]
+    client.put(f"/api/servicios/{primero['id']}/autorizar")
+    assert vencidos(limit=2) == ["2021-01-01", "2022-01-01"]
+    assert vencidos(skip=1, limit=1) == ["2022-01-01"]
+    client.put(f"/api/servicios/{primero['id']}/autorizar", params={"autorizado": "false"})
+    assert vencidos(limit=1) == ["2020-01-01"]
+
+    assert client.get("/api/equipos/garantias-por-vencer", params={"dias": 30}).json() == []
+    assert client.get("/api/equipos/garantias-por-vencer", params={"dias": 3000000}).status_code == 422
+
+
+@pytest.mark.parametrize("backend", ["client", "client_mongo"])
+def test_garantias_por_vencer_ordenadas_y_paginadas(backend, request):
+    client = request.getfixturevalue(backend)
+    cliente = crear_cliente(client)
+    hoy = date.today()
+    equipos = {
+        dias: crear_equipo(client, cliente["id"], numero_serie=f"MSV-{dias}", en_garantia=dias != 1,
+                           fecha_fin_garantia=(hoy + timedelta(days=dias)).isoformat())
+        for dias in (10, 5, 30, 31, 1)
+    }
+
+    def por_vencer(**params):
+        respuesta = client.get("/api/equipos/garantias-por-vencer", params={"dias": 30, **params})
+        return [equipo["numero_serie"] for equipo in respuesta.json()]
+
+    assert por_vencer() == ["MSV-5", "MSV-10", "MSV-30"]
+    assert por_vencer(skip=1, limit=1) == ["MSV-10"]
+
+    client.put(f"/api/equipos/{equipos[5]['id']}", json={**datos_equipo(equipos[5]), "en_garantia": False})
+    client.delete(f"/api/equipos/{equipos[10]['id']}")
+    assert por_vencer() == ["MSV-30"]
+
+
+def test_indices_en_memoria_no_dejan_restos(client):
+    cliente = crear_cliente(client)
+    equipo = crear_equipo(client, cliente["id"], en_garantia=True, fecha_fin_garantia="2099-01-01")
+    repo = server.app.state.repositorio
+    assert repo._equipos_por_numero_serie == {"MSV-001": {equipo["id"]}}
+
+    client.delete(f"/api/clientes/{cliente['id']}", params={"cascade": "true"})
+    assert not repo._equipos_por_cliente
+    assert not repo._equipos_por_numero_serie
+    assert not repo._servicios_por_equipo
+    assert not repo._garantias
+    assert not repo._pendientes_por_fecha
+
+
+def test_ids_inexistentes(client):
+    assert client.put("/api/clientes/no-existe", json={"nombre": "X"}).status_code == 404
+    assert client.delete("/api/equipos/no-existe").status_code == 404
+    assert client.put("/api/servicios/no-existe/autorizar").status_code == 404
+
+
+@pytest.mark.parametrize("backend", ["client", "client_mongo"])
+def test_ids_que_no_son_uuid(backend, request):
+    client = request.getfixturevalue(backend)
+    # Un equipo importado pendiente tiene cliente_id nulo; no debe confundirse con un id mal formado
+    client.post("/api/equipos", json={"modelo": "M", "numero_serie": "S", "confirmado": False})
+    assert client.delete("/api/clientes/no-es-un-uuid").status_code == 404
+    assert client.delete("/api/clientes/no-es-un-uuid", params={"cascade": "true"}).status_code == 404
+
+
+def test_fechas_invalidas(client):
+    cliente = crear_cliente(client)
+    respuesta = client.post("/api/equipos", json={
+        "modelo": "M", "numero_serie": "S", "cliente_id": cliente["id"], "fecha_fin_garantia": "bad"
+    })
+    assert respuesta.status_code == 422
+    equipo = client.post("/api/equipos", json={
+        "modelo": "M", "numero_serie": "S", "cliente_id": cliente["id"], "fecha_fin_garantia": ""
+    }).json()
+    assert equipo["fecha_fin_garantia"] is None
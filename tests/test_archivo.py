@@ -0,0 +1,142 @@
+"""Tests del archivo de servicios en servicios_historico (RepositorioMotor sobre mongomock-motor)"""
+import uuid
+from datetime import date, datetime, timezone
+
+import pytest
+
+import server
+from tests.conftest import crear_cliente, crear_equipo
+
+CORTE = date(2022, 1, 1)
+
+
+@pytest.fixture
+def client(client_mongo):
+    return client_mongo
+
+
+@pytest.fixture
+def db(client):
+    return server.app.state.repositorio.db
+
+
+def contar(client, coleccion, filtro=None):
+    return client.portal.call(coleccion.count_documents, filtro or {})
+
+
+def archivar(client):
+    return client.portal.call(server.app.state.repositorio.archivar_servicios, CORTE, 500)
+
+
+def crear_equipo_anual(client):
+    """Equipo con servicios el 1 de enero de 2020, 2021 y 2022; autoriza los dos primeros"""
+    cliente = crear_cliente(client)
+    equipo = crear_equipo(client, cliente["id"], periodicidad="anual", fecha_primer_servicio="2020-01-01")
+    servicios = client.get("/api/servicios").json()
+    for servicio in servicios[:2]:
+        client.put(f"/api/servicios/{servicio['id']}/autorizar")
+    return cliente, equipo, servicios
+
+
+def test_archiva_solo_autorizados_anteriores_al_corte(client, db):
+    _, _, servicios = crear_equipo_anual(client)
+
+    assert archivar(client) == 2
+    assert contar(client, db.servicios_historico) == 2
+    assert contar(client, db.servicios) == 1
+    assert archivar(client) == 0
+    # Los listados siguen viendo los servicios archivados
+    assert sorted(s["id"] for s in client.get("/api/servicios").json()) == sorted(s["id"] for s in servicios)
+
+
+def test_historico_solo_se_consulta_antes_del_corte(client, db):
+    crear_equipo_anual(client)
+    archivar(client)
+    # Un documento en el histórico con fecha posterior al corte solo aparecería si se consultara
+    servicio = client.portal.call(db.servicios.find_one, {})
+    client.portal.call(db.servicios_historico.insert_one, {**servicio, "_id": uuid.uuid4()})
+
+    posteriores = client.get("/api/servicios", params={"desde": "2022-01-01"}).json()
+    assert [s["fecha_programada"] for s in posteriores] == ["2022-01-01"]
+    anteriores = client.get("/api/servicios", params={"desde": "2021-01-01", "hasta": "2022-01-01"}).json()
+    assert [s["fecha_programada"] for s in anteriores] == ["2021-01-01"]
+
+
+def test_servicio_en_ambas_colecciones_aparece_una_vez(client, db):
+    _, _, servicios = crear_equipo_anual(client)
+    # Copia que queda en el histórico si el archivo se corta entre la copia y el borrado
+    servicio = client.portal.call(db.servicios.find_one, {"_id": uuid.UUID(servicios[0]["id"])})
+    client.portal.call(db.servicios_historico.insert_one, dict(servicio))
+    client.portal.call(
+        db.metadatos.insert_one, {"_id": "archivo", "corte": datetime(2022, 1, 1, tzinfo=timezone.utc)}
+    )
+
+    ids = [s["id"] for s in client.get("/api/servicios").json()]
+    assert sorted(ids) == sorted(s["id"] for s in servicios)
+    fechas = client.get("/api/servicios", params={"fields": "fecha_programada"}).json()
+    assert len(fechas) == 3 and all(set(s) == {"fecha_programada"} for s in fechas)
+
+
+def test_desautorizar_durante_el_archivo(client, db, monkeypatch):
+    _, _, servicios = crear_equipo_anual(client)
+    desautorizado = uuid.UUID(servicios[0]["id"])
+    coleccion = type(db.servicios_historico)
+    bulk_write = coleccion.bulk_write
+
+    async def bulk_write_y_desautorizar(self, *args, **kwargs):
+        resultado = await bulk_write(self, *args, **kwargs)
+        await db.servicios.update_one({"_id": desautorizado}, {"$set": {"autorizado": False}})
+        return resultado
+
+    monkeypatch.setattr(coleccion, "bulk_write", bulk_write_y_desautorizar)
+
+    assert archivar(client) == 1
+    assert contar(client, db.servicios_historico, {"_id": desautorizado}) == 0
+    assert contar(client, db.servicios, {"_id": desautorizado, "autorizado": False}) == 1
+
+
+def test_eliminar_equipo_durante_el_archivo(client, db, monkeypatch):
+    _, equipo, _ = crear_equipo_anual(client)
+    coleccion = type(db.servicios_historico)
+    bulk_write = coleccion.bulk_write
+
+    async def eliminar_equipo_y_bulk_write(self, *args, **kwargs):
+        # El equipo se elimina entero entre la lectura del lote y la copia al histórico
+        await server.app.state.repositorio.eliminar_equipo(equipo["id"])
+        return await bulk_write(self, *args, **kwargs)
+
+    monkeypatch.setattr(coleccion, "bulk_write", eliminar_equipo_y_bulk_write)
+
+    assert archivar(client) == 0
+    assert contar(client, db.servicios_historico) == 0
+
+
+def test_desautorizar_servicio_archivado(client, db):
+    _, _, servicios = crear_equipo_anual(client)
+    archivar(client)
+
+    respuesta = client.put(f"/api/servicios/{servicios[0]['id']}/autorizar", params={"autorizado": "false"})
+    assert respuesta.status_code == 200
+    assert contar(client, db.servicios_historico) == 1
+    assert contar(client, db.servicios, {"_id": uuid.UUID(servicios[0]["id"]), "autorizado": False}) == 1
+    # Autorizar uno archivado no lo mueve
+    assert client.put(f"/api/servicios/{servicios[1]['id']}/autorizar").status_code == 200
+    assert contar(client, db.servicios_historico) == 1
+
+
+def test_eliminar_equipo_borra_su_historico(client, db):
+    _, equipo, _ = crear_equipo_anual(client)
+    archivar(client)
+
+    assert client.delete(f"/api/equipos/{equipo['id']}").status_code == 200
+    assert contar(client, db.servicios_historico) == 0
+    assert contar(client, db.servicios) == 0
+
+
+def test_eliminar_cliente_en_cascada_cuenta_el_historico(client, db):
+    cliente, _, _ = crear_equipo_anual(client)
+    archivar(client)
+
+    respuesta = client.delete(f"/api/clientes/{cliente['id']}", params={"cascade": "true"}).json()
+    assert respuesta["eliminados"] == {"clientes": 1, "equipos": 1, "servicios": 1, "servicios_historico": 2}
+    assert contar(client, db.servicios_historico) == 0
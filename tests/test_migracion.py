@@ -0,0 +1,88 @@
+"""Tests de migrar_almacenamiento.py sobre mongomock-motor"""
+import asyncio
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+import server
+from migrar_almacenamiento import COLECCIONES, migrar_coleccion
+
+EQUIPO_ID = str(uuid.uuid4())
+CLIENTE_ID = str(uuid.uuid4())
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import mongomock.collection
+
+    monkeypatch.setattr(mongomock.collection, "BSON", None)
+    client = mongomock_motor.AsyncMongoMockClient(uuidRepresentation="standard", tz_aware=True)
+    return client["serviagenda_migracion"]
+
+
+def equipo_antiguo(**extra):
+    return {
+        "_id": ObjectId(), "id": EQUIPO_ID, "modelo": "M", "numero_serie": "S", "cliente_id": CLIENTE_ID,
+        "en_garantia": True, "fecha_fin_garantia": "2025-12-31", **extra,
+    }
+
+
+def test_migra_de_hijas_a_padres():
+    assert COLECCIONES == ["servicios", "equipos", "clientes"]
+
+
+def test_valores_no_convertibles_se_dejan_como_estan(db):
+    otro_id = str(uuid.uuid4())
+
+    async def migrar():
+        await db.equipos.insert_many([
+            equipo_antiguo(fecha_fin_garantia="31/12/2025"),
+            equipo_antiguo(id="no-es-un-uuid"),
+            equipo_antiguo(id=otro_id, cliente_id="tampoco", fecha_fin_garantia=""),
+        ])
+        migrados = await migrar_coleccion(db.equipos, lote=1)
+        return migrados, {str(equipo.get("id", equipo["_id"])): equipo for equipo in await db.equipos.find({}).to_list(None)}
+
+    migrados, equipos = asyncio.run(migrar())
+    assert migrados == 2
+    # La fecha mal escrita se conserva; el resto del documento se migra
+    assert equipos[EQUIPO_ID]["fecha_fin_garantia"] == "31/12/2025"
+    assert equipos[EQUIPO_ID]["cliente_id"] == uuid.UUID(CLIENTE_ID)
+    # La referencia mal formada se conserva y el texto vacío pasa a None
+    assert equipos[otro_id]["cliente_id"] == "tampoco"
+    assert equipos[otro_id]["fecha_fin_garantia"] is None
+    # El id mal formado queda sin migrar
+    assert isinstance(equipos["no-es-un-uuid"]["_id"], ObjectId)
+
+
+def test_equipo_con_fecha_antigua_se_lista_y_se_corrige(client_mongo):
+    db = server.app.state.repositorio.db
+    cliente = client_mongo.post("/api/clientes", json={"nombre": "Hospital San Juan"}).json()
+    equipo = {**equipo_antiguo(fecha_fin_garantia="31/12/2025"), "cliente_id": uuid.UUID(cliente["id"])}
+    del equipo["id"]
+    equipo["_id"] = uuid.UUID(EQUIPO_ID)
+    client_mongo.portal.call(db.equipos.insert_one, equipo)
+
+    respuesta = client_mongo.get("/api/equipos")
+    assert respuesta.status_code == 200
+    assert respuesta.json()[0]["fecha_fin_garantia"] == "31/12/2025"
+
+    datos = {"modelo": "M", "numero_serie": "S", "cliente_id": cliente["id"], "fecha_fin_garantia": "2025-12-31"}
+    actualizado = client_mongo.put(f"/api/equipos/{EQUIPO_ID}", json=datos)
+    assert actualizado.status_code == 200
+    assert actualizado.json()["fecha_fin_garantia"] == "2025-12-31"
+
+
+def test_eliminar_equipo_sin_migrar_no_toca_sus_servicios(client_mongo):
+    db = server.app.state.repositorio.db
+    client_mongo.portal.call(db.equipos.insert_one, equipo_antiguo())
+    client_mongo.portal.call(db.servicios.insert_one, {
+        "_id": uuid.uuid4(), "equipo_id": uuid.UUID(EQUIPO_ID), "autorizado": False,
+        "fecha_programada": datetime(2026, 1, 15, tzinfo=timezone.utc),
+    })
+
+    assert client_mongo.delete(f"/api/equipos/{EQUIPO_ID}").status_code == 404
+    assert client_mongo.portal.call(db.servicios.count_documents, {}) == 1
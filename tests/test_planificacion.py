@@ -0,0 +1,136 @@
+"""Tests de la planificación de servicios por capacidad diaria"""
+import uuid
+from collections import Counter
+from datetime import date, datetime, timezone
+
+import pytest
+
+import server
+from tests.conftest import crear_cliente, crear_equipo, datos_equipo
+from server import balancear_fechas
+
+
+def test_balancear_respeta_la_fecha_si_hay_hueco():
+    ocupacion = {date(2026, 3, 10): 1}
+    assert balancear_fechas([date(2026, 3, 10)], ocupacion, capacidad=2, tolerancia=3) == [date(2026, 3, 10)]
+    assert ocupacion[date(2026, 3, 10)] == 2
+
+
+def test_balancear_usa_el_dia_mas_cercano_con_hueco():
+    ocupacion = {date(2026, 3, 10): 2, date(2026, 3, 11): 2}
+    assert balancear_fechas([date(2026, 3, 10)], ocupacion, capacidad=2, tolerancia=3) == [date(2026, 3, 9)]
+
+
+def test_balancear_con_la_ventana_llena_usa_el_dia_menos_cargado():
+    ocupacion = {date(2026, 3, 9): 5, date(2026, 3, 10): 4, date(2026, 3, 11): 3}
+    assert balancear_fechas([date(2026, 3, 10)], ocupacion, capacidad=2, tolerancia=1) == [date(2026, 3, 11)]
+
+
+def test_balancear_no_adelanta_la_fecha_minima():
+    ocupacion = {date(2026, 3, 10): 2, date(2026, 3, 11): 2}
+    fechas = balancear_fechas([date(2026, 3, 10)], ocupacion, capacidad=2, tolerancia=3, minima=date(2026, 3, 10))
+    assert fechas == [date(2026, 3, 12)]
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setattr(server, "CAPACIDAD_DIARIA", 2)
+    monkeypatch.setattr(server, "TOLERANCIA_DIAS", 3)
+    return client
+
+
+def test_alta_masiva_reparte_la_carga(client):
+    cliente = crear_cliente(client, "Clínica Central")
+    for i in range(6):
+        crear_equipo(client, cliente["id"], numero_serie=f"VM-{i}", periodicidad="anual", fecha_primer_servicio="2026-05-10")
+
+    servicios = client.get("/api/calendario/2026/5").json()
+    por_dia = {}
+    for servicio in servicios:
+        por_dia[servicio["fecha_programada"]] = por_dia.get(servicio["fecha_programada"], 0) + 1
+    assert len(servicios) == 6
+    assert max(por_dia.values()) == 2
+    # Ninguno se adelanta a fecha_primer_servicio
+    assert all("2026-05-10" <= dia <= "2026-05-13" for dia in por_dia)
+
+
+def test_regenerar_no_duplica_servicios_desplazados(client):
+    cliente = crear_cliente(client, "Clínica Central")
+    equipos = []
+    for i in range(3):
+        equipos.append(crear_equipo(
+            client, cliente["id"], numero_serie=f"VM-{i}", periodicidad="anual", fecha_primer_servicio="2026-05-10"
+        ))
+
+    # El tercer equipo quedó desplazado; se autoriza y se vuelve a guardar el equipo
+    ultimo = equipos[-1]
+    servicio = [s for s in client.get("/api/servicios").json() if s["equipo_id"] == ultimo["id"]][0]
+    assert servicio["fecha_programada"] != "2026-05-10"
+    client.put(f"/api/servicios/{servicio['id']}/autorizar", params={"autorizado": "true"})
+    client.put(f"/api/equipos/{ultimo['id']}", json=datos_equipo(ultimo))
+
+    servicios = [s for s in client.get("/api/servicios").json() if s["equipo_id"] == ultimo["id"]]
+    assert len(servicios) == 3
+
+
+def test_tolerancia_mayor_que_el_intervalo_no_pierde_servicios(client, monkeypatch):
+    monkeypatch.setattr(server, "TOLERANCIA_DIAS", 40)
+    cliente = crear_cliente(client, "Clínica Central")
+    equipo = crear_equipo(
+        client, cliente["id"], numero_serie="VM-1", periodicidad="mensual", fecha_primer_servicio="2026-01-15"
+    )
+    primero = client.get("/api/servicios").json()[0]
+    client.put(f"/api/servicios/{primero['id']}/autorizar", params={"autorizado": "true"})
+
+    # Al regenerar, el servicio autorizado del 15 de enero no debe tapar el de febrero
+    client.put(f"/api/equipos/{equipo['id']}", json=datos_equipo(equipo))
+    fechas = [s["fecha_programada"] for s in client.get("/api/servicios").json()]
+    assert len(fechas) == 25
+    assert fechas[:3] == ["2026-01-15", "2026-02-15", "2026-03-15"]
+
+
+def comprobar_ocupacion(client):
+    """Los contadores por día coinciden con los servicios (activos y archivados)"""
+    servicios = client.get("/api/servicios").json()
+    esperado = Counter(date.fromisoformat(s["fecha_programada"]) for s in servicios)
+    repo = server.app.state.repositorio
+    assert client.portal.call(repo.ocupacion_por_dia, date(2020, 1, 1), date(2030, 1, 1)) == dict(esperado)
+
+
+@pytest.mark.parametrize("backend", ["client", "client_mongo"])
+def test_contadores_por_dia_siguen_altas_y_bajas(backend, request, monkeypatch):
+    client = request.getfixturevalue(backend)
+    monkeypatch.setattr(server, "CAPACIDAD_DIARIA", 2)
+    cliente = crear_cliente(client, "Clínica Central")
+    equipos = [
+        crear_equipo(
+            client, cliente["id"], numero_serie=f"VM-{i}", periodicidad="trimestral", fecha_primer_servicio="2021-05-10"
+        )
+        for i in range(3)
+    ]
+    comprobar_ocupacion(client)
+
+    primero = client.get("/api/servicios").json()[0]
+    client.put(f"/api/servicios/{primero['id']}/autorizar")
+    client.portal.call(server.app.state.repositorio.archivar_servicios, date(2022, 1, 1), 500)
+    datos = {**datos_equipo(equipos[0]), "fecha_primer_servicio": "2021-06-01"}
+    client.put(f"/api/equipos/{equipos[0]['id']}", json=datos)
+    comprobar_ocupacion(client)
+
+    client.delete(f"/api/equipos/{equipos[1]['id']}")
+    comprobar_ocupacion(client)
+    client.delete(f"/api/clientes/{cliente['id']}", params={"cascade": "true"})
+    comprobar_ocupacion(client)
+
+
+def test_reconstruir_ocupacion(client_mongo):
+    repo = server.app.state.repositorio
+    dia = datetime(2026, 3, 10, tzinfo=timezone.utc)
+    # Un servicio que no pasó por insertar_servicios (anterior a los contadores) y un contador que sobra
+    client_mongo.portal.call(repo.db.servicios.insert_one, {
+        "_id": uuid.uuid4(), "equipo_id": uuid.uuid4(), "fecha_programada": dia, "autorizado": False,
+    })
+    client_mongo.portal.call(repo.db.ocupacion_diaria.insert_one, {"_id": datetime(2026, 3, 11, tzinfo=timezone.utc), "total": 4})
+
+    client_mongo.portal.call(repo.reconstruir_ocupacion)
+    assert client_mongo.portal.call(repo.ocupacion_por_dia, date(2026, 3, 1), date(2026, 4, 1)) == {date(2026, 3, 10): 1}